@@ -1,7 +1,19 @@
 import logging
+import socket
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from MQTTPublisher import MQTTPublisher
 
+class NoDelayHTTPAdapter(HTTPAdapter):
+    """HTTP adapter whose pooled connections use TCP_NODELAY and TCP keepalive."""
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = [
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
 class HttpSmsSender:
     """Send SMS via HTTP POST to a configured endpoint."""
     def __init__(self, url, auth_token=None, timeout=10):
@@ -16,6 +28,11 @@ class HttpSmsSender:
         self.timeout = timeout
         self._logger = logging.getLogger(self.__class__.__name__)
         self.mqtt_publisher = None
+        # Persistent session so consecutive sends reuse the TCP/TLS connection
+        self._session = requests.Session()
+        adapter = NoDelayHTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
 
     def send_sms(self, recipient, message, **kwargs):
         """
@@ -34,7 +51,7 @@ class HttpSmsSender:
         }
         data.update(kwargs)
         try:
-            resp = requests.post(self.url, json=data, headers=headers, timeout=self.timeout)
+            resp = self._session.post(self.url, data=orjson.dumps(data), headers=headers, timeout=self.timeout)
             resp.raise_for_status()
             self._logger.info(f"SMS sent to {recipient} via HTTP POST.")
             return resp
@@ -77,6 +94,12 @@ class HttpSmsSender:
             self._logger.error(f"Failed to forward SMS to MQTT: {e}")
             return False
 
+    def close(self):
+        """
+        Close the HTTP session and release its pooled connections.
+        """
+        self._session.close()
+
 # Example usage:
 # if __name__ == "__main__":
 #     logging.basicConfig(level=logging.INFO)
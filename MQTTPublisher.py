@@ -1,11 +1,15 @@
-import time
-import json
+import re
+import orjson
+import socket
+import threading
 import paho.mqtt.client as mqtt
 import logging
-from typing import Dict
+from typing import Dict, Optional, Union
 
 logger = logging.getLogger(__name__)
 
+_NON_DIGITS_RE = re.compile(r'\D')
+
 class MQTTPublisher:
     """Efficient MQTT publisher with connection management"""
     
@@ -20,40 +24,78 @@ class MQTTPublisher:
         self._logger.debug('MQTTPublisher initialize')
         self._broker = broker
         self._port = port
+        self._connected = threading.Event()
         self._client: mqtt.Client = mqtt.Client(protocol=mqtt.MQTTv311)
+        # publish() only enqueues to paho's network thread; never let it block on these limits
+        self._client.max_inflight_messages_set(1000)
+        self._client.max_queued_messages_set(0)
+        # paho's network loop reconnects on its own, backing off from 1 to 30 seconds
+        self._client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self._client.on_connect = self.on_connect
         self._client.on_disconnect = self.on_disconnect
         self._connect()
     
     def _connect(self):
         """
-        Connect to the MQTT broker and start the network loop.
-        Raises an exception if connection fails.
+        Start connecting to the MQTT broker in the background and start the network loop.
+        The loop keeps retrying until the broker is reachable; use wait_connected to wait for it.
+        Raises an exception if the connection cannot be started (e.g. invalid broker address).
         """
         try:
-            self._client.connect(self._broker, self._port)
+            self._client.connect_async(self._broker, self._port, keepalive=60)
             self._client.loop_start()
-            logger.info("Connected to MQTT broker")
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             raise
         
+    def _set_socket_options(self):
+        """
+        Disable Nagle's algorithm and enable TCP keepalive on the broker socket.
+        Each SMS is a single small PUBLISH packet, so there is nothing to coalesce.
+        """
+        sock = self._client.socket()
+        if sock is None:
+            return
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        except OSError as e:
+            self._logger.warning(f"Failed to set MQTT socket options: {e}")
+
+    def on_connect(self, client, userdata, flags, rc):
+        """
+        Callback for MQTT client connect event. Applies socket options on every (re)connect.
+        :param client: The MQTT client instance
+        :param userdata: The private user data
+        :param flags: Response flags sent by the broker
+        :param rc: The connection result code
+        """
+        if rc != 0:
+            self._logger.error(f"MQTT broker refused the connection: {rc}")
+            return
+        self._set_socket_options()
+        self._connected.set()
+        logger.info("Connected to MQTT broker")
+
     def on_disconnect(self, client, userdata, rc):
         """
-        Callback for MQTT client disconnect event. Attempts to reconnect until successful.
+        Callback for MQTT client disconnect event. The network loop reconnects by itself.
         :param client: The MQTT client instance
         :param userdata: The private user data
         :param rc: The disconnection result code
         """
-        self._logger.warning("Disconnected from MQTT broker. Attempting to reconnect...")
-        while True:
-            try:
-                client.reconnect()
-                self._logger.info("Reconnected to MQTT broker")
-                break
-            except Exception as e:
-                self._logger.error(f"Reconnect failed: {e}")
-                time.sleep(5)  # Wait before retrying
-                
+        self._connected.clear()
+        self._logger.warning("Disconnected from MQTT broker. Reconnecting...")
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the client is connected to the MQTT broker.
+        :param timeout: Maximum time to wait in seconds (None waits indefinitely)
+        :return: True if connected, False on timeout
+        """
+        return self._connected.wait(timeout)
+
+
     def publish(self, message: Dict) -> bool:
         """
         Publish an SMS message to the MQTT broker.
@@ -62,11 +104,27 @@ class MQTTPublisher:
         :return: True if published successfully, False otherwise
         """
         try:
-            payload = json.dumps(message['body'])
-            message['sender'] = ''.join(filter(str.isdigit, message['sender']))
-            result = self._client.publish(f"modem/{message['sender']}/{message['timestamp']}", payload)
+            payload = orjson.dumps(message['body'])
+            message['sender'] = _NON_DIGITS_RE.sub('', message['sender'])
+            return self.publish_raw(message['sender'], message['timestamp'], payload)
+        except Exception as e:
+            logger.error(f"Error publishing to MQTT: {e}")
+            return False
+
+    def publish_raw(self, sender: str, timestamp: Union[int, str], payload: Union[bytes, str]) -> bool:
+        """
+        Publish an already JSON-encoded SMS body to the MQTT broker.
+        The topic is constructed as modem/{sender}/{timestamp}; the sender must already be digits only.
+        Messages are sent with QoS 0: durability is provided by the Redis queue, not by MQTT.
+        :param sender: Sender phone number (digits only)
+        :param timestamp: Message timestamp in seconds since the epoch
+        :param payload: JSON-encoded message body (str or bytes)
+        :return: True if published successfully, False otherwise
+        """
+        try:
+            result = self._client.publish(f"modem/{sender}/{timestamp}", payload, qos=0, retain=False)
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                logger.info(f"Published SMS from {message.get('sender', 'unknown')} to MQTT")
+                logger.debug("Published SMS from %s to MQTT", sender)
                 return True
             else:
                 logger.error(f"Failed to publish to MQTT: {result.rc}")
@@ -1,37 +1,76 @@
 import redis
+import socket
 import logging
-from typing import Any, Optional
+from typing import Any, List, Optional
+
+# Atomically pop up to ARGV[1] items from the head of a list in a single round-trip
+DRAIN_SCRIPT = """
+local v = redis.call('LRANGE', KEYS[1], 0, ARGV[1] - 1)
+redis.call('LTRIM', KEYS[1], ARGV[1], -1)
+return v
+"""
+
+# Detect a dead server within about a minute instead of the kernel default of hours
+KEEPALIVE_OPTIONS = {
+    getattr(socket, option): value
+    for option, value in (('TCP_KEEPIDLE', 30), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3))
+    if hasattr(socket, option)
+}
+
 
 class RedisClient:
-    def __init__(self, host='localhost', port=6379, decode_responses=True, socket_keepalive=True):
+    def __init__(self, host='localhost', port=6379, decode_responses=True, socket_keepalive=True, max_connections=8):
         """
         Initialize the RedisClient instance and connect to the Redis server.
         :param host: Redis server host
         :param port: Redis server port
         :param decode_responses: Whether to decode responses to strings
         :param socket_keepalive: Whether to enable TCP keepalive
+        :param max_connections: Size of the connection pool shared by all threads using this client
         """
         self._logger = logging.getLogger(self.__class__.__name__)
-        self._client = redis.Redis(
+        self._pool = redis.ConnectionPool(
             host=host,
             port=port,
             decode_responses=decode_responses,
-            socket_keepalive=socket_keepalive
+            max_connections=max_connections,
+            socket_keepalive=socket_keepalive,
+            socket_keepalive_options=KEEPALIVE_OPTIONS if socket_keepalive else None,
+            # PING connections idle for longer than this before reuse, so stale ones are replaced
+            health_check_interval=30
         )
+        self._client = redis.Redis(connection_pool=self._pool)
+        self._drain_script = self._client.register_script(DRAIN_SCRIPT)
+        self._has_blmpop = True
 
-    def rpush(self, queue: str, value: Any) -> int:
+    def rpush(self, queue: str, *values: Any) -> int:
         """
-        Push a value onto the right end of a Redis list (queue).
+        Push one or more values onto the right end of a Redis list (queue).
+        All values are pushed atomically by a single RPUSH command.
         :param queue: Name of the Redis list (queue)
-        :param value: Value to push onto the queue
+        :param values: Values to push onto the queue
         :return: The length of the list after the push operation
         """
         try:
-            self._logger.debug(f"RPUSH to {queue}: {value}")
-            return self._client.rpush(queue, value)
+            self._logger.debug("RPUSH %d values to %s", len(values), queue)
+            return self._client.rpush(queue, *values)
         except Exception as e:
             self._logger.exception(f"rpush error {e}")
 
+    def lpush(self, queue: str, *values: Any) -> int:
+        """
+        Push one or more values onto the left end of a Redis list (queue).
+        Values are pushed one after another, so the last value ends up at the head.
+        :param queue: Name of the Redis list (queue)
+        :param values: Values to push onto the queue
+        :return: The length of the list after the push operation
+        """
+        try:
+            self._logger.debug("LPUSH %d values to %s", len(values), queue)
+            return self._client.lpush(queue, *values)
+        except Exception as e:
+            self._logger.exception(f"lpush error {e}")
+
     def blpop(self, queue: str, timeout: int = 0) -> Optional[Any]:
         """
         Block until a value is popped from the left end of a Redis list (queue), or until timeout.
@@ -40,11 +79,41 @@ class RedisClient:
         :return: Tuple of (queue name, value) if successful, None otherwise
         """
         try:
-            self._logger.debug(f"BLPOP from {queue} with timeout {timeout}")
+            self._logger.debug("BLPOP from %s with timeout %s", queue, timeout)
             return self._client.blpop(queue, timeout=timeout)
         except Exception as e:
             self._logger.error(f"blpop error {e}" )
 
+    def blmpop(self, queue: str, count: int, timeout: float = 0) -> List[Any]:
+        """
+        Block until the Redis list (queue) is non-empty, then pop up to count values from its left end.
+        Uses BLMPOP (Redis 7+); on older servers falls back to the drain script followed by BLPOP.
+        Errors are logged and re-raised so the caller can back off.
+        :param queue: Name of the Redis list (queue)
+        :param count: Maximum number of values to pop
+        :param timeout: Timeout in seconds (0 means block indefinitely)
+        :return: List of popped values, empty on timeout
+        """
+        try:
+            self._logger.debug("BLMPOP %d from %s with timeout %s", count, queue, timeout)
+            if self._has_blmpop:
+                try:
+                    result = self._client.blmpop(timeout, 1, queue, direction='LEFT', count=count)
+                    return result[1] if result else []
+                except redis.ResponseError as e:
+                    if 'unknown command' not in str(e).lower():
+                        raise
+                    self._logger.info("BLMPOP not supported by the server, falling back to LRANGE/LTRIM")
+                    self._has_blmpop = False
+            values = self._drain_script(keys=[queue], args=[count])
+            if values:
+                return values
+            item = self._client.blpop(queue, timeout=timeout)
+            return [item[1]] if item else []
+        except Exception as e:
+            self._logger.error(f"blmpop error {e}")
+            raise
+
     def pipeline(self):
         """
         Create a Redis pipeline for batch operations.
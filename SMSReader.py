@@ -1,11 +1,67 @@
+import re
 import time
+import select
 import serial
 import serial.tools.list_ports
 import logging
 from datetime import datetime
+from functools import lru_cache
 from typing import Generator, Optional, Dict, List
 from contextlib import contextmanager
 
+# Per-read serial timeout; the overall deadline of a command is enforced in _read_response
+SERIAL_TIMEOUT: float = 0.05
+RESPONSE_TIMEOUT: float = 2.0
+# A full inbox listing can run to tens of kilobytes
+LIST_TIMEOUT: float = 30.0
+NOTIFICATION_TIMEOUT: float = 1.0
+# Pre-encoded AT commands
+AT_PING: bytes = b'AT\r'
+AT_ECHO_OFF: bytes = b'ATE0\r'
+AT_TEXT_MODE: bytes = b'AT+CMGF=1\r'
+AT_NOTIFY_NEW_SMS: bytes = b'AT+CNMI=2,1,0,0,0\r'
+AT_LIST_UNREAD: bytes = b'AT+CMGL="REC UNREAD"\r'
+AT_LIST_ALL: bytes = b'AT+CMGL="ALL"\r'
+AT_READ_PREFIX: bytes = b'AT+CMGR='
+AT_DELETE_PREFIX: bytes = b'AT+CMGD='
+CR: bytes = b'\r'
+
+# Deletions concatenated into one command line; keeps it well below the modem's line length limit
+DELETES_PER_COMMAND: int = 16
+
+_NON_DIGITS_RE = re.compile(rb'\D')
+
+# One SMS in a text mode +CMGL/+CMGR response: header fields, then the body up to the
+# next header or the blank line before the final result code. +CMGR headers carry no
+# index. A body line of "OK" (e.g. "yes\nOK\nbye", or just "OK") is part of the text,
+# and a body that runs to the end of a truncated response does not match at all.
+_SMS_RE = re.compile(
+    rb'^\+CMG[LR]: (?:(\d+),)?"([^"]*)","([^"]*)",[^,\r\n]*,"(\d\d/\d\d/\d\d),(\d\d:\d\d:\d\d)[^"]*"[^\r\n]*'
+    rb'(.*?)(?=\r?\n\+CMG[LR]: |\r?\n\r?\n(?:OK|ERROR)\r?(?:\n|\Z))',
+    re.MULTILINE | re.DOTALL
+)
+
+
+@lru_cache(maxsize=64)
+def _hour_epoch(year: int, month: int, day: int, hour: int) -> int:
+    """
+    Epoch seconds of the start of a local-time hour; cached since SMS timestamps cluster.
+    """
+    return int(datetime(year, month, day, hour).timestamp())
+
+
+def _parse_timestamp(date: bytes, clock: bytes) -> int:
+    """
+    Convert a modem date ("yy/MM/dd") and time ("hh:mm:ss") to epoch seconds.
+    Slices the fixed-width fields instead of going through strptime.
+    :param date: Date part of the SMS header
+    :param clock: Time part of the SMS header, without the timezone suffix
+    :return: Seconds since the epoch (local time)
+    """
+    base = _hour_epoch(2000 + int(date[0:2]), int(date[3:5]), int(date[6:8]), int(clock[0:2]))
+    return base + int(clock[3:5]) * 60 + int(clock[6:8])
+
+
 class CheckModemPort:
     def __init__(self):
         self.at_port: str = None
@@ -29,18 +85,16 @@ class CheckModemPort:
             self._logger.warning("\n❗ No modem responded to AT command on available ports.")
         return self.at_port
     
-    def check_at_command(self, port, baudrate=115200) -> bool:
+    def check_at_command(self, port, baudrate=115200, timeout=1.0) -> bool:
         try:
-            ser = serial.Serial(port=port, baudrate=baudrate, timeout=1)
-            ser.write(b'AT\r')
-            time.sleep(0.5)
-            response = ser.read_all().decode(errors='ignore').strip()
-            ser.close()
-
-            if "OK" in response:
-                return True
-            else:
-                return False
+            # read_until returns as soon as OK arrives; the port timeout bounds a silent port
+            with serial.Serial(port=port, baudrate=baudrate, timeout=timeout) as ser:
+                ser.write(AT_PING)
+                response = ser.read_until(b'OK\r\n')
+
+            if b'ERROR' in response:
+                self._logger.debug(f"{port} answered ERROR to AT")
+            return b'OK' in response
         except serial.SerialException:
             return False
 
@@ -48,15 +102,19 @@ class CheckModemPort:
 class SMSReader:
     """Efficient SMS reader with connection management"""
 
-    def __init__(self, port: str, baudrate: int):
+    def __init__(self, port: str, baudrate: int, fast_baudrate: Optional[int] = None):
         """
         Initialize the SMSReader instance and set up serial connection parameters.
         :param port: Serial port for the modem
         :param baudrate: Baudrate for the serial connection
+        :param fast_baudrate: Optional higher baudrate to switch the modem to (with RTS/CTS flow control)
         """
         self._port = port
         self._baudrate = baudrate
+        self._fast_baudrate = fast_baudrate
         self._serial_conn: Optional[serial.Serial] = None
+        self._rx_buffer = bytearray()
+        self._pending_indices: List[str] = []
         self._logger = logging.getLogger(self.__class__.__name__)
         
     @contextmanager
@@ -67,7 +125,8 @@ class SMSReader:
         :yield: Open serial.Serial connection
         """
         if self._serial_conn is None or not self._serial_conn.is_open:
-            self._serial_conn = serial.Serial(self._port, self._baudrate, timeout=5)
+            self._rx_buffer.clear()
+            self._serial_conn = self._open_serial()
             self._init_modem()
         try:
             yield self._serial_conn
@@ -78,29 +137,166 @@ class SMSReader:
             self._serial_conn = None
             raise Exception(f"Serial connection error: {e}")
     
+    def _open_serial(self) -> serial.Serial:
+        """
+        Open the serial port. When a fast baudrate is configured, use it with hardware flow
+        control; if the modem does not answer at that rate, switch it over with AT+IPR from
+        the base baudrate, falling back to the base baudrate if that fails.
+        :return: Open serial.Serial connection
+        """
+        if not self._fast_baudrate:
+            return serial.Serial(self._port, self._baudrate, timeout=SERIAL_TIMEOUT)
+
+        ser = serial.Serial(self._port, self._fast_baudrate, rtscts=True, timeout=SERIAL_TIMEOUT)
+        if self._probe(ser):
+            return ser
+        ser.rtscts = False
+        ser.baudrate = self._baudrate
+        if self._probe(ser):
+            ser.write(f'AT+IPR={self._fast_baudrate}\r'.encode())
+            if b'OK' in (self._read_response(ser) or b''):
+                ser.baudrate = self._fast_baudrate
+                ser.rtscts = True
+                if self._probe(ser):
+                    self._logger.info(f"Switched modem to {self._fast_baudrate} baud")
+                    return ser
+                ser.rtscts = False
+                ser.baudrate = self._baudrate
+        self._logger.warning(f"Modem does not support {self._fast_baudrate} baud, using {self._baudrate}")
+        return ser
+
+    def _probe(self, ser: serial.Serial) -> bool:
+        """
+        Check whether the modem answers a plain AT command at the current port settings.
+        :param ser: Open serial connection
+        :return: True if the modem answered OK, False otherwise
+        """
+        ser.reset_input_buffer()
+        self._rx_buffer.clear()
+        ser.write(AT_PING)
+        ok = b'OK' in (self._read_response(ser) or b'')
+        self._rx_buffer.clear()
+        return ok
+
     def _init_modem(self) -> None:
         """
-        Initialize the modem in text mode (AT+CMGF=1).
+        Initialize the modem: disable command echo (ATE0) so responses carry only the
+        modem's own lines, select text mode (AT+CMGF=1) and enable +CMTI new message
+        notifications (AT+CNMI=2,1,0,0,0).
+        """
+        ret = b''
+        for command in (AT_ECHO_OFF, AT_TEXT_MODE, AT_NOTIFY_NEW_SMS):
+            self._serial_conn.write(command)
+            ret += self._read_response(self._serial_conn) or b''
+        self._logger.info(f"Modem initialized [{ret.decode(errors='ignore')}]")
+
+    def _read_line(self, ser: serial.Serial, deadline: float) -> Optional[bytes]:
+        """
+        Read one complete line from the modem.
+        A partial line is kept for the next call when the deadline expires.
+        :param ser: Open serial connection
+        :param deadline: time.monotonic() value after which to give up
+        :return: The line including its terminator, or None on timeout
+        """
+        while True:
+            self._rx_buffer += ser.read_until(b'\n')
+            if self._rx_buffer.endswith(b'\n'):
+                line = bytes(self._rx_buffer)
+                self._rx_buffer.clear()
+                return line
+            if time.monotonic() >= deadline:
+                return None
+
+    def _wait_readable(self, ser: serial.Serial, timeout: float) -> None:
+        """
+        Block in the kernel until the port has data or the timeout expires, instead of
+        waking up every SERIAL_TIMEOUT while idle. Ports that cannot be selected on
+        (e.g. on Windows) fall back to the per-read timeout.
+        :param ser: Open serial connection
+        :param timeout: Maximum time to wait in seconds
+        """
+        if timeout <= 0 or self._rx_buffer or ser.in_waiting:
+            return
+        try:
+            select.select([ser], [], [], timeout)
+        except (AttributeError, TypeError, ValueError, OSError):
+            pass
+
+    def _handle_notification(self, line: bytes) -> bool:
+        """
+        Record the storage index of a +CMTI new message notification.
+        :param line: Stripped line received from the modem
+        :return: True if the line was a +CMTI notification, False otherwise
+        """
+        if not line.startswith(b'+CMTI:'):
+            return False
+        index = line.rsplit(b',', 1)[-1].strip().decode(errors='ignore')
+        self._logger.debug("New SMS notification for index %s", index)
+        self._pending_indices.append(index)
+        return True
+
+    def _discard_stale_input(self, ser: serial.Serial) -> None:
+        """
+        Drop leftovers of earlier responses (e.g. after a timed out command) so the next
+        command does not consume them, keeping any +CMTI notifications among them.
+        :param ser: Open serial connection
+        """
+        while ser.in_waiting:
+            line = self._read_line(ser, time.monotonic())
+            if line is None:
+                break
+            line = line.strip()
+            if not self._handle_notification(line) and line:
+                self._logger.debug("Discarding stale modem output: %r", line)
+        self._rx_buffer.clear()
+
+    def _read_response(self, ser: serial.Serial, timeout: float = RESPONSE_TIMEOUT) -> Optional[bytes]:
+        """
+        Read a modem response up to its final result code (OK or ERROR).
+        Returns as soon as the result code arrives instead of waiting a fixed delay.
+        An OK/ERROR line only ends the response when it is the first line (after any
+        command echo) or follows a blank line, so an SMS whose text is "OK" is not
+        mistaken for the result code.
+        :param ser: Open serial connection
+        :param timeout: Overall deadline in seconds, so a silent modem still returns
+        :return: Raw response from the modem, or None if it timed out before the result code
         """
-        self._serial_conn.write(b'AT+CMGF=1\r')
-        time.sleep(0.5)
-        ret = self._serial_conn.read(self._serial_conn.in_waiting or 100).decode(errors='ignore')
-        self._serial_conn.flush()
-        self._logger.info(f"Modem initialized [{ret}]")
+        deadline = time.monotonic() + timeout
+        response = bytearray()
+        seen_text = False
+        after_blank = True
+        while (raw_line := self._read_line(ser, deadline)) is not None:
+            line = raw_line.strip()
+            # Notifications may arrive in the middle of a command response
+            if self._handle_notification(line):
+                continue
+            response += raw_line
+            if line.startswith((b'+CMS ERROR', b'+CME ERROR')):
+                break
+            if line in (b'OK', b'ERROR') and (after_blank or not seen_text):
+                break
+            after_blank = not line
+            # The command echo (before ATE0 takes effect) does not count as response text
+            if line and not (not seen_text and line[:2].upper() == b'AT'):
+                seen_text = True
+        else:
+            self._logger.warning(f"Timeout waiting for response from modem after {len(response)} bytes")
+            return None
+        return bytes(response)
     
-    def _send_command(self, command: str) -> str:
+    def _send_command(self, command: bytes, timeout: float = RESPONSE_TIMEOUT) -> Optional[bytes]:
         """
-        Send an AT command to the modem and return the response as a string.
-        :param command: The AT command to send
-        :return: Response from the modem
+        Send an AT command to the modem and return the raw response.
+        AT traffic is ASCII, so it is left undecoded; only SMS bodies are decoded, in the parser.
+        :param command: The encoded AT command to send, including the trailing CR
+        :param timeout: Overall deadline for the response in seconds
+        :return: Response from the modem, or None if it timed out
         """
-        self._logger.debug(f"Sending command: {command}")
-        cmd_bytes = f'{command}\r'.encode()
+        self._logger.debug("Sending command: %r", command)
         with self.get_connection() as ser:
-            ser.flush()
-            ser.write(cmd_bytes)
-            time.sleep(0.5)  # Reduced wait time
-            return ser.read(ser.in_waiting or 1024).decode(errors='ignore')
+            self._discard_stale_input(ser)
+            ser.write(command)
+            return self._read_response(ser, timeout)
 
     def _wait_for_ok(self, timeout: float = 1.0) -> bool:
         """
@@ -108,91 +304,105 @@ class SMSReader:
         :param timeout: Timeout in seconds
         :return: True if 'OK' received, False otherwise
         """
-        end_time = time.time() + timeout
-        buffer = ""
         with self.get_connection() as ser:
-            while time.time() < end_time:
-                if ser.in_waiting:
-                    buffer += ser.read(ser.in_waiting).decode(errors='ignore')
-                    if 'OK' in buffer:
-                        return True
-                    if 'ERROR' in buffer:
-                        self._logger.error("Received ERROR from modem")
-                        return False
-                time.sleep(0.1)
-        self._logger.warning("Timeout waiting for OK from modem")
-        return False
+            response = self._read_response(ser, timeout)
+        if response is None:
+            return False
+        if b'ERROR' in response:
+            self._logger.error("Received ERROR from modem")
+            return False
+        return b'OK' in response
     
-    def _parse_sms_message(self, lines: List[str]) -> List[Dict]:
+    def _parse_sms_message(self, response: bytes, index: Optional[str] = None, include_read: bool = False) -> List[Dict]:
         """
-        Efficiently parse SMS messages from a list of modem response lines.
-        Only messages with status 'REC UNREAD' are collected and deleted after parsing.
-        :param lines: List of response lines from the modem
+        Efficiently parse SMS messages from a raw +CMGL or +CMGR modem response.
+        The whole response is scanned once with a compiled regex; header fields are ASCII
+        and only the message body is decoded (as UTF-8).
+        Only messages with status 'REC UNREAD' are collected, unless include_read is set.
+        Must stay free of side effects on the modem: the caller deletes the messages
+        only after they have been enqueued, so deleting here would lose them on failure.
+        :param response: Raw response from the modem
+        :param index: Storage index of the message, for +CMGR responses which do not carry one
+        :param include_read: Also collect messages with status 'REC READ'
         :return: List of parsed SMS message dictionaries
         """
         messages = []
-        current_msg = None
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
+        for match in _SMS_RE.finditer(response):
+            msg_index, status, sender, date, clock, body = match.groups()
+            if status != b'REC UNREAD' and not (include_read and status == b'REC READ'):
                 continue
-                
-            if line.startswith('+CMGL:'):
-                # Save previous message if it's unread
-                if current_msg and current_msg.get('body'): # and current_msg['status'] == 'REC UNREAD':
-                    messages.append(current_msg)
-                
-                # Parse new message header
-                try:
-                    parts = line.split(',')
-                    if len(parts) >= 6:
-                        index = parts[0].split(':')[1].strip()
-                        status = parts[1].strip().strip('"')
-                        sender = parts[2].strip().strip('"')
-                        try:
-                            date = parts[4].strip().strip('"') + ' ' + parts[5].strip().split('+')[0]
-                        except IndexError:
-                            date = "1/1/1970 00:00:00"
-                        
-                        dt = datetime.strptime(date, "%y/%m/%d %H:%M:%S")
-                        
-                        current_msg = {
-                            'index': index,
-                            'status': status,
-                            'sender': sender,
-                            'timestamp': int(dt.timestamp()),
-                            'body': ''
-                        }
-                except (IndexError, ValueError) as e:
-                    self._logger.warning(f"Failed to parse SMS header: {line}, error: {e}")
-                    current_msg = None
-                    
-            elif current_msg is not None and line and not line.startswith('OK') and not line.startswith('ERROR'):
-                current_msg['body'] += line + '\n'
-        
-        # Don't forget the last message
-        if current_msg and current_msg.get('body') and current_msg['status'] == 'REC UNREAD':
-            self._logger.debug(f"Adding unread message: {current_msg}")
-            messages.append(current_msg)
-
-        for msg in messages:
-            self.delete_sms(msg['index'])
+            try:
+                timestamp = _parse_timestamp(date, clock)
+            except ValueError as e:
+                self._logger.warning(f"Failed to parse SMS header: {match[0]!r}, error: {e}")
+                continue
+            messages.append({
+                'index': msg_index.decode('ascii') if msg_index else index,
+                'status': status.decode('ascii'),
+                'sender': _NON_DIGITS_RE.sub(b'', sender).decode('ascii'),
+                'timestamp': timestamp,
+                'body': body.strip().replace(b'\r\n', b'\n').decode('utf-8', 'replace')
+            })
+        self._logger.debug("Parsed unread messages: %s", messages)
         return messages
-    
-    def read_sms(self) -> List[Dict]:
+
+    def read_sms(self, include_read: bool = False) -> Optional[List[Dict]]:
         """
         Read all unread SMS messages from the modem.
-        Uses AT+CMGL="REC UNREAD" to fetch only unread messages.
-        :return: List of unread SMS message dictionaries
+        Uses AT+CMGL="REC UNREAD" to fetch only unread messages, or AT+CMGL="ALL" to also
+        fetch received messages that are already marked read.
+        The modem marks listed messages read, so a cut-off listing is not parsed: the
+        caller has to rescan instead of enqueueing truncated bodies.
+        :param include_read: Also return messages with status 'REC READ'
+        :return: List of SMS message dictionaries, None on error or timeout
         """
         try:
-            response = self._send_command('AT+CMGL="REC UNREAD"')
-            lines = response.splitlines()
-            return self._parse_sms_message(lines)
+            response = self._send_command(AT_LIST_ALL if include_read else AT_LIST_UNREAD, LIST_TIMEOUT)
         except Exception as e:
             self._logger.error(f"Error reading SMS: {e}")
+            return None
+        if response is None:
+            return None
+        return self._parse_sms_message(response, include_read=include_read)
+
+    def wait_for_sms(self, timeout: float = NOTIFICATION_TIMEOUT) -> List[str]:
+        """
+        Block until the modem announces new SMS messages with +CMTI notifications.
+        :param timeout: Maximum time to wait in seconds
+        :return: Storage indices of the new messages, empty on timeout
+        """
+        if not self._pending_indices:
+            deadline = time.monotonic() + timeout
+            with self.get_connection() as ser:
+                while not self._pending_indices:
+                    self._wait_readable(ser, deadline - time.monotonic())
+                    line = self._read_line(ser, deadline)
+                    if line is None:
+                        break
+                    self._handle_notification(line.strip())
+        indices, self._pending_indices = list(dict.fromkeys(self._pending_indices)), []
+        return indices
+
+    def read_sms_at(self, index: str, include_read: bool = False) -> List[Dict]:
+        """
+        Read a single unread SMS message from the modem by its index.
+        Uses AT+CMGR=<index>, so only the announced message is transferred.
+        :param index: Storage index of the SMS message
+        :param include_read: Also return the message if it is already marked read, e.g. when
+                             retrying a message that was listed but could not be enqueued
+        :return: List with the parsed message, empty if it is not unread or on error.
+                 On error or timeout the index is queued again for wait_for_sms.
+        """
+        try:
+            response = self._send_command(AT_READ_PREFIX + index.encode('ascii') + CR)
+        except Exception as e:
+            self._logger.error(f"Error reading SMS {index}: {e}")
+            response = None
+        if response is None:
+            # The modem may already have marked it read; retry rather than parse a partial body
+            self._pending_indices.append(index)
             return []
+        return self._parse_sms_message(response, index, include_read)
     
     
     def delete_sms(self, index: str) -> bool:
@@ -202,11 +412,40 @@ class SMSReader:
         :return: True if deletion was successful, False otherwise
         """
         try:
-            response = self._send_command(f'AT+CMGD={index}')
-            return 'OK' in response
+            response = self._send_command(AT_DELETE_PREFIX + index.encode('ascii') + CR)
+            return response is not None and b'OK' in response
         except Exception as e:
             self._logger.error(f"Error deleting SMS {index}: {e}")
             return False
+
+    def delete_many(self, indices: List[str]) -> bool:
+        """
+        Delete several SMS messages from the modem with few round-trips.
+        The deletions are concatenated into command lines (AT+CMGD=1;+CMGD=2;...), so the
+        modem answers each group of up to DELETES_PER_COMMAND deletions with a single OK.
+        Each command line is sent only after the previous one's result code, as V.250
+        requires. A bad index aborts the rest of its command line, so a group answered
+        with an error is retried one index at a time.
+        :param indices: Indices of the SMS messages to delete
+        :return: True if all deletions were successful, False otherwise
+        """
+        success = True
+        for i in range(0, len(indices), DELETES_PER_COMMAND):
+            group = indices[i:i + DELETES_PER_COMMAND]
+            try:
+                response = self._send_command(
+                    AT_DELETE_PREFIX + b';+CMGD='.join(index.encode('ascii') for index in group) + CR)
+            except Exception as e:
+                self._logger.error(f"Error deleting SMS {indices[i:]}: {e}")
+                return False
+            if response is not None and b'OK' in response:
+                continue
+            self._logger.warning(f"Deleting SMS {group} failed, retrying one by one")
+            failed = [index for index in group if not self.delete_sms(index)]
+            if failed:
+                self._logger.error(f"Failed to delete SMS {failed}")
+                success = False
+        return success
     
     def close(self):
         """
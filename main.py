@@ -1,9 +1,9 @@
-from ensurepip import version
+import signal
 import threading
 import time
-from typing import Final
+from typing import Dict, Final, List, Tuple
 import logging
-import json
+import orjson
 import click
 from MQTTPublisher import MQTTPublisher
 from RedisClient import RedisClient
@@ -18,79 +18,152 @@ logger = logging.getLogger(__name__)
 # Configuration
 SERIAL_PORT: Final[str] = ''#'/dev/ttyUSB3'  # update as needed
 BAUDRATE: Final[int] = 115200
+FAST_BAUDRATE: Final[int] = 0  # e.g. 921600; 0 keeps BAUDRATE
 REDIS_HOST: Final[str] = 'localhost'
 REDIS_PORT: Final[int] = 6379
 REDIS_QUEUE: Final[str] = 'sms_queue'
+REDIS_MAX_CONNECTIONS: Final[int] = 4  # one per thread, plus headroom
 MQTT_BROKER: Final[str] = 'localhost'
 MQTT_PORT: Final[int] = 1883
 MQTT_TOPIC: Final[str] = 'modem/sms'
+PUBLISH_BATCH_SIZE: Final[int] = 64
+FULL_SCAN_INTERVAL: Final[float] = 60.0  # seconds between safety-net scans of the whole inbox
+MAX_BACKOFF: Final[float] = 30.0  # upper bound of the retry delay after repeated thread errors
+THREAD_JOIN_TIMEOUT: Final[float] = 5.0
 
 
-def read_sms_thread(sms_reader: SMSReader, redis_client:RedisClient, queue_name: str) -> None:
+def encode_message(msg: Dict) -> bytes:
     """
-    Continuously reads SMS messages from the modem using sms_reader,
+    Encode an SMS for the Redis queue as b"<sender>/<timestamp> <body_json>".
+    The body is JSON-encoded here, once; the publisher forwards those bytes to MQTT
+    as they are and never parses JSON.
+    :param msg: Parsed SMS message dictionary (sender already digits only)
+    :return: Queue entry bytes
+    """
+    return f"{msg['sender']}/{msg['timestamp']} ".encode('ascii') + orjson.dumps(msg['body'])
+
+
+def decode_message(entry: bytes) -> Tuple[str, str, bytes]:
+    """
+    Split a queue entry produced by encode_message.
+    :param entry: Queue entry bytes
+    :return: Tuple of (sender, timestamp, body_json)
+    """
+    header, payload = entry.split(b' ', 1)
+    sender, timestamp = header.decode('ascii').split('/')
+    return sender, timestamp, payload
+
+
+def read_sms_thread(sms_reader: SMSReader, redis_client:RedisClient, queue_name: str, stop: threading.Event) -> None:
+    """
+    Continuously reads new SMS messages from the modem using sms_reader,
     pushes them to the specified Redis queue using redis_client,
     and deletes them from the modem after successful enqueue.
-    Runs as a background thread.
+    Runs as a background thread until stop is set.
     :param sms_reader: SMSReader instance for reading SMS
     :param redis_client: RedisClient instance for Redis operations
     :param queue_name: Name of the Redis queue to push messages to
+    :param stop: Event that ends the thread when set
     """
     logger.info("SMS reading thread started")
-    
-    while True:
+
+    # Scan the whole inbox for messages that arrived while we were not listening;
+    # afterwards only the messages announced by +CMTI notifications are read, with a
+    # periodic full scan as a safety net for lost notifications.
+    # Every enqueued message is deleted, so anything still stored on the modem has not
+    # been delivered: the full scans list read messages too (at-least-once delivery),
+    # which also recovers messages marked read by a crash or a failed read.
+    rescan = True
+    last_scan = 0.0
+    failures = 0
+    # Messages that could not be enqueued, re-read by index (they are marked read by
+    # now) instead of waiting for the next full scan
+    retry_indices: List[str] = []
+    while not stop.is_set():
         try:
-            messages = sms_reader.read_sms()
-            
+            if retry_indices:
+                messages = [msg for index in retry_indices for msg in sms_reader.read_sms_at(index, include_read=True)]
+                retry_indices = []
+            elif rescan or time.monotonic() - last_scan >= FULL_SCAN_INTERVAL:
+                messages = sms_reader.read_sms(include_read=True)
+                if messages is None:
+                    raise RuntimeError("Failed to list SMS messages, will rescan")
+                rescan = False
+                last_scan = time.monotonic()
+            else:
+                # Announced messages, plus any whose read timed out and may already be marked read
+                messages = [msg for index in sms_reader.wait_for_sms()
+                            for msg in sms_reader.read_sms_at(index, include_read=True)]
+
             if messages:
-                # Batch operations for better performance
-                pipeline = redis_client.pipeline()
-                for msg in messages:
-                    pipeline.rpush(queue_name, json.dumps(msg))
-                pipeline.execute()
-                
-                # Delete messages after successful enqueue
-                for msg in messages:
-                    sms_reader.delete_sms(msg['index'])
-                    
+                # Enqueue the whole batch atomically in one round-trip
+                if not redis_client.rpush(queue_name, *(encode_message(msg) for msg in messages)):
+                    retry_indices = [msg['index'] for msg in messages]
+                    raise RuntimeError(f"Failed to enqueue {len(messages)} SMS messages, will retry them")
+
+                # Delete messages after successful enqueue. Messages that fail to delete stay on
+                # the SIM as REC READ; the next full scan lists them again (AT+CMGL="ALL"), so
+                # they are enqueued a second time and their deletion is retried.
+                if not sms_reader.delete_many([msg['index'] for msg in messages]):
+                    logger.error("Failed to delete some enqueued SMS messages, the next full scan retries them")
+
                 logger.info(f"Processed {len(messages)} new SMS messages")
-            
-            time.sleep(2)  # Reduced polling frequency
-            
+            failures = 0
+
         except Exception as e:
             logger.error(f"Error in SMS reading thread: {e}")
-            time.sleep(5)
+            rescan = True
+            # Back off exponentially on repeated failures; returns early on shutdown
+            stop.wait(min(MAX_BACKOFF, 2 ** failures))
+            failures += 1
 
 
-def mqtt_publish_thread(mqtt_publisher: MQTTPublisher, redis_client: RedisClient, queue_name: str) -> None:
+def mqtt_publish_thread(mqtt_publisher: MQTTPublisher, redis_client: RedisClient, queue_name: str, stop: threading.Event) -> None:
     """
     Continuously pops messages from the specified Redis queue and publishes
-    them to the MQTT broker using mqtt_publisher. Runs as a background thread.
+    them to the MQTT broker using mqtt_publisher. Runs as a background thread until stop is set.
     :param mqtt_publisher: MQTTPublisher instance for publishing to MQTT
     :param redis_client: RedisClient instance for Redis operations
     :param queue_name: Name of the Redis queue to consume messages from
+    :param stop: Event that ends the thread when set
     """
     logger.info("MQTT publishing thread started")
-    
-    while True:
+
+    failures = 0
+    while not stop.is_set():
         try:
-            # Block until a message is available
-            item = redis_client.blpop(queue_name,0)
-            if item:
-                _, payload = item
-                message = json.loads(payload)
-                mqtt_publisher.publish(message)
-                
+            # Leave messages in Redis while the broker is unreachable; QoS 0 publishes would be lost
+            if not mqtt_publisher.wait_connected(1):
+                continue
+            # Pop up to a batch of queued messages in one blocking round-trip
+            batch = redis_client.blmpop(queue_name, PUBLISH_BATCH_SIZE, 1)
+            for position, entry in enumerate(batch):
+                try:
+                    sender, timestamp, payload = decode_message(entry)
+                except ValueError:
+                    # Skip a malformed entry rather than dropping the rest of the popped batch
+                    logger.error(f"Dropping malformed queue entry: {entry!r}")
+                    continue
+                if not mqtt_publisher.publish_raw(sender, timestamp, payload):
+                    # Put the unpublished remainder back at the head of the queue, in order
+                    remainder = batch[position:]
+                    if not redis_client.lpush(queue_name, *reversed(remainder)):
+                        logger.error(f"Failed to requeue {len(remainder)} messages, they are lost")
+                    raise RuntimeError(f"Failed to publish, requeued {len(remainder)} messages")
+            failures = 0
+
         except Exception as e:
             logger.error(f"Error in MQTT publishing thread: {e}")
-            import time
-            time.sleep(5)
+            # Back off exponentially on repeated failures; returns early on shutdown
+            stop.wait(min(MAX_BACKOFF, 2 ** failures))
+            failures += 1
 
 
 @click.command()
 @click.option('-l', '--log-level', default='WARNING', help='Set the logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)')
 @click.option('-p','--serial-port', default=SERIAL_PORT, show_default=True, help='Serial port for the modem')
 @click.option('-b','--baudrate', default=BAUDRATE, show_default=True, type=int, help='Baudrate for the serial port')
+@click.option('-fb','--fast-baudrate', default=FAST_BAUDRATE, show_default=True, type=int, help='Switch the modem to this baudrate with RTS/CTS flow control (0 to disable)')
 @click.option('-r','--redis-host', default=REDIS_HOST, show_default=True, help='Redis server host')
 @click.option('-v', '--version', is_flag=True, help='Show the version and exit')
 @click.option('-rp','--redis-port', default=REDIS_PORT, show_default=True, type=int, help='Redis server port')
@@ -98,7 +171,7 @@ def mqtt_publish_thread(mqtt_publisher: MQTTPublisher, redis_client: RedisClient
 @click.option('-mq','--mqtt-broker', default=MQTT_BROKER, show_default=True, help='MQTT broker address')
 @click.option('-mp','--mqtt-port', default=MQTT_PORT, show_default=True, type=int, help='MQTT broker port')
 @click.option('-mt','--mqtt-topic', default=MQTT_TOPIC, show_default=True, help='MQTT topic for SMS messages')
-def main(log_level, serial_port, baudrate, redis_host, redis_port, redis_queue, mqtt_broker, mqtt_port, mqtt_topic, version):
+def main(log_level, serial_port, baudrate, fast_baudrate, redis_host, redis_port, redis_queue, mqtt_broker, mqtt_port, mqtt_topic, version):
     """
     Main entry point for the SMS-to-MQTT service. Initializes the SMS reader,
     MQTT publisher, and Redis client, then starts background threads for reading
@@ -106,6 +179,7 @@ def main(log_level, serial_port, baudrate, redis_host, redis_port, redis_queue,
     :param log_level: Logging level as a string (e.g., 'INFO')
     :param serial_port: Serial port for the modem
     :param baudrate: Baudrate for the serial port
+    :param fast_baudrate: Higher baudrate to switch the modem to, 0 to keep baudrate
     :param redis_host: Redis server host
     :param redis_port: Redis server port
     :param redis_queue: Redis queue name for SMS
@@ -125,6 +199,8 @@ def main(log_level, serial_port, baudrate, redis_host, redis_port, redis_queue,
 
     sms_reader = None
     mqtt_publisher = None
+    threads = []
+    shutdown = threading.Event()
     try:
         if serial_port is None or serial_port == '':
             try:
@@ -135,40 +211,56 @@ def main(log_level, serial_port, baudrate, redis_host, redis_port, redis_queue,
                 return
 
         # Initialize components
-        sms_reader = SMSReader(serial_port, baudrate)
+        sms_reader = SMSReader(serial_port, baudrate, fast_baudrate or None)
         mqtt_publisher = MQTTPublisher(mqtt_broker, mqtt_port, mqtt_topic)
+        # One client for both threads; redis-py hands each thread its own pooled connection,
+        # so the publisher blocking in BLMPOP never holds up the reader's RPUSH.
+        # Queue entries are orjson bytes, so skip decoding replies to str.
+        redis_client = RedisClient(host=redis_host, port=redis_port, decode_responses=False,
+                                   max_connections=REDIS_MAX_CONNECTIONS)
         
         # Start threads
         t1 = threading.Thread(
             target=read_sms_thread, 
             args=(sms_reader, 
-                  RedisClient(host=redis_host, port=redis_port), 
-                  redis_queue), 
+                  redis_client, 
+                  redis_queue,
+                  shutdown), 
             daemon=True
         )
         
         t2 = threading.Thread(
             target=mqtt_publish_thread, 
             args=(mqtt_publisher, 
-                  RedisClient(host=redis_host, port=redis_port),
-                  redis_queue, ), 
+                  redis_client,
+                  redis_queue,
+                  shutdown), 
             daemon=True
         )
         
-        t1.start()
-        t2.start()
+        threads = [t1, t2]
+        for t in threads:
+            t.start()
         
         logger.info("SMS-to-MQTT service started successfully")
         
-        # Keep main thread alive
-        while True:
-            time.sleep(1)
-            
+        # Sleep until SIGINT/SIGTERM requests a shutdown. The handlers are installed only
+        # now, so Ctrl-C still interrupts the port scan and startup.
+        signal.signal(signal.SIGINT, lambda *args: shutdown.set())
+        signal.signal(signal.SIGTERM, lambda *args: shutdown.set())
+        shutdown.wait()
+        logger.info("Shutting down...")
+
     except KeyboardInterrupt:
+        # Ctrl-C before the handlers are installed, e.g. during the port scan
         logger.info("Shutting down...")
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
     finally:
+        # Let the threads finish their current iteration before closing what they use
+        shutdown.set()
+        for t in threads:
+            t.join(timeout=THREAD_JOIN_TIMEOUT)
         # Cleanup resources
         if sms_reader:
             sms_reader.close()